@@ -51,88 +51,308 @@ __all__ = (
     'no',
     'then',
     'amb',
+    'par_amb',
     'seq',
     'predicate',
+    'condition',
+    'guard',
+    'tabled',
+    'memoized',
+    'reset_table',
+    'compiled',
     'cut',
     # re-export from .unification
     'resolve',
+    'resolve_n',
     'unify',
     'unify_any',
     'var',
 )
 
-from collections import ChainMap
-from collections.abc import Iterable, Mapping
-from dataclasses import dataclass
-from functools import reduce, wraps
-from itertools import count
-from typing import Any, Callable, ClassVar, Optional
+import os
+from collections.abc import Generator, Iterable, Iterator, Mapping, Sequence
+from dataclasses import dataclass, field
+from enum import IntEnum
+from functools import wraps
+from inspect import CO_VARARGS, CO_VARKEYWORDS, signature
+from itertools import count, islice
+from queue import Empty, Full, Queue, SimpleQueue
+from threading import Event, Lock, RLock, Thread, local
+from types import FunctionType
+from typing import Any, Callable, ClassVar, Optional, ParamSpec, cast
 
 from .extension import extend
 
 
-@dataclass(frozen=True, slots=True)
 class Variable:
     '''Variable objects are bound to values in a monadic computation.'''
-    id: int
+    # A plain class with slots is cheaper to create than a frozen dataclass,
+    # and Variables are created a lot.
+    __slots__ = ('id',)
     counter:ClassVar = count()
 
+    def __init__(self, id:int):  # pylint: disable=W0622
+        self.id = id
+
+    def __repr__(self):
+        return f'Variable(id={self.id})'
+
+    def __eq__(self, other):
+        return self is other or type(other) is Variable and self.id == other.id
+
+    def __hash__(self):
+        return self.id
+
+
+_next_id = Variable.counter.__next__
+
 
 def var():
     '''Helper function to create Variables.'''
-    return Variable(next(Variable.counter))
+    return Variable(_next_id())
 
 
-class Subst(ChainMap):
+def _rebuild(kind:type, items:list):
+    '''Make a list or tuple of type kind, or of a subclass of either, from
+    the list items.'''
+    if kind is list:
+        return items
+    if kind is tuple:
+        return tuple(items)
+    # Named tuples take their items as separate arguments:
+    make = getattr(kind, '_make', None)
+    return kind(items) if make is None else make(items)
+
+
+class Subst:
     '''A substitution environment that maps Variables to values. This is called
     a variable binding. Variables are bound during monadic computations and
     unbound again during backtracking.'''
+    # All bindings live in a single dict, keyed by the ids of the Variables,
+    # because ints hash much faster than dataclasses. Every Variable that
+    # gets bound is also recorded on the trail, so that backtracking can
+    # unbind Variables in reverse order up to a mark, i.e. an earlier length
+    # of the trail. So is every binding that is overwritten when a chain of
+    # bindings is compressed, as a pair of the id and the previous value.
+    __slots__ = ('bindings', 'trail')
+
+    def __init__(self, bindings:Optional[dict]=None):
+        self.bindings = {} if bindings is None else bindings
+        self.trail: list[int|tuple[int, Any]] = []
+
+    def __contains__(self, variable:Variable):
+        return variable.id in self.bindings
+
+    def __iter__(self):
+        # Variables are equal if their ids are:
+        return map(Variable, self.bindings)
+
+    def __len__(self):
+        return len(self.bindings)
 
     def deref(self, obj):
         '''Chase down Variable bindings.'''
-        while isinstance(obj, Variable) and obj in self:
-            obj = self[obj]
+        if type(obj) is not Variable:
+            return obj
+        bindings = self.bindings
+        value = bindings.get(obj.id, obj)
+        if value is obj or type(value) is not Variable:
+            # Most Variables are unbound or bound to a non-Variable:
+            return value
+        chain = [obj.id]
+        obj = value
+        value = bindings.get(obj.id, obj)
+        while value is not obj:
+            chain.append(obj.id)
+            obj = value
+            if type(obj) is not Variable:
+                break
+            value = bindings.get(obj.id, obj)
+        # Compress the chain, so that all Variables in it are bound to its
+        # end, like in union-find, but remember the old bindings on the
+        # trail. The last Variable in it is already bound to the end:
+        trail = self.trail
+        for key in chain[:-1]:
+            trail.append((key, bindings[key]))
+            bindings[key] = obj
         return obj
 
     def smooth(self, obj):
         '''Recursively replace all variables with their bindings.'''
-        match self.deref(obj):
-            case list() | tuple() as sequence:
-                return type(sequence)(self.smooth(each) for each in sequence)
-            case thing:
-                return thing
+        deref = self.deref
+        obj = deref(obj)
+        cls = type(obj)
+        if (cls is not list and cls is not tuple
+                and not issubclass(cls, (list, tuple))):
+            return obj
+        # Instead of recursing into nested lists and tuples, we keep a stack
+        # of frames, each holding a sequence, an iterator over its remaining
+        # items, its items smoothed so far, and whether any of them changed.
+        # A nested sequence also remembers the item it was dereferenced from.
+        # The ids of the sequences on the stack are kept, too, because a
+        # Variable bound to a term that contains it would be expanded
+        # forever:
+        stack = []
+        expanding = {id(obj)}
+        items = iter(obj)
+        done = []
+        changed = False
+        while True:
+            for item in items:
+                value = deref(item)
+                kind = type(value)
+                # Like in unification, subclasses of list and tuple are
+                # sequences, too, but the exact types are checked first:
+                if (kind is list or kind is tuple
+                        or issubclass(kind, (list, tuple))):
+                    if id(value) in expanding:
+                        raise ValueError(f'cyclic term: {item!r}')
+                    expanding.add(id(value))
+                    stack.append((obj, items, done, changed, item))
+                    obj, items, done, changed = value, iter(value), [], False
+                    break
+                if value is not item:
+                    changed = True
+                done.append(value)
+            else:
+                # Lists are mutable, so they are always copied, but a tuple
+                # in which nothing was replaced can be returned as it is:
+                if changed or isinstance(obj, list):
+                    value = _rebuild(type(obj), done)
+                else:
+                    value = obj
+                if not stack:
+                    return value
+                expanding.discard(id(obj))
+                obj, items, done, changed, item = stack.pop()
+                if value is not item:
+                    changed = True
+                done.append(value)
+
+    def assign(self, variable:Variable, value):
+        '''Bind the unbound variable to value.'''
+        self.trail.append(variable.id)
+        self.bindings[variable.id] = value
+
+    def pop_to(self, mark:int):
+        '''Unbind all Variables that were bound since the trail had the
+        length mark, and restore the bindings that were compressed.'''
+        bindings = self.bindings
+        trail = self.trail
+        for key in reversed(trail[mark:]):
+            if type(key) is int:
+                del bindings[key]
+            else:
+                key, value = key
+                bindings[key] = value
+        del trail[mark:]
+
+    def clone(self) -> 'Subst':
+        '''Return a Subst with the same bindings that can be changed
+        independently of this one. Its trail starts out empty.'''
+        return Subst(self.bindings.copy())
 
     @property
-    class proxy(Mapping):
-        '''A proxy interface to Subst.'''
-        def __init__(self, subst):
-            self._subst = subst
-        def __getitem__(self, variable:Variable):
+    def proxy(self):
+        '''A proxy interface to a snapshot of Subst, which stays valid when
+        Subst is changed by further resolution.'''
+        return _Proxy(self.clone())
+
+
+def _immutable(obj) -> bool:
+    '''Check whether the smoothed object obj contains no lists.'''
+    todo = [obj]
+    while todo:
+        obj = todo.pop()
+        if isinstance(obj, list):
+            return False
+        if isinstance(obj, tuple):
+            todo.extend(obj)
+    return True
+
+
+class _Proxy(Mapping):
+    '''A proxy interface to Subst.'''
+    def __init__(self, subst):
+        self._subst = subst
+        # Values are smoothed when they are first looked up, and only once.
+        # Smoothing all of them up front would be wasted on the many
+        # Variables that are never looked up:
+        self._values = {}
+    def __getitem__(self, variable:Variable):
+        if type(variable) is not Variable:
             return self._subst.smooth(variable)
-        def __iter__(self):
-            return iter(self._subst)
-        def __len__(self):
-            return len(self._subst)
+        values = self._values
+        if variable in values:
+            return values[variable]
+        value = self._subst.smooth(variable)
+        # Lists are copied by smooth, because callers may mutate what they
+        # get back, so only values without lists can be handed out twice:
+        if _immutable(value):
+            values[variable] = value
+        return value
+    def __iter__(self):
+        return iter(self._subst)
+    def __len__(self):
+        return len(self._subst)
 
 
-Result = Optional[tuple[Subst, 'Next']]
+# A Result that is a Thunk instead of a pair is a bounce of the trampoline:
+Result = Optional['tuple[Subst, Next] | Thunk']
 Next = Callable[[], Result]
 Emit = Callable[[Subst, Next], Result]
 Step = Callable[[Emit, Next, Next], Result]
 Goal = Callable[[Subst], Step]
 
 
-def tailcall(goal:Step|Emit|Next) -> Callable[..., Result]:
+class Thunk:
+    '''A suspended tail call of fn with args. Only the trampoline runs a
+    Thunk, exactly once, after which it is recycled. A Thunk is its own
+    Result, so that a bounce doesn't need to allocate a tuple.'''
+    __slots__ = ('fn', 'args')
+    fn: Callable[..., Result]
+    args: tuple
+
+
+# Thunks that have already been run, ready for reuse:
+_thunks: list[Thunk] = []
+
+
+# The parameters of a function decorated with 'tailcall':
+_Params = ParamSpec('_Params')
+
+
+def tailcall(goal:Callable[_Params, Result]) -> Callable[_Params, Result]:
     '''Tail-call elimination.'''
-    @wraps(goal)  # type: ignore
+    reuse = _thunks.pop
+    @wraps(goal)
     def wrapped(*args) -> Result:
-        return (), wraps(goal)(lambda: goal(*args))  # type: ignore
-    return wrapped
+        try:
+            thunk = reuse()
+        except IndexError:
+            thunk = Thunk()
+        thunk.fn = goal
+        thunk.args = args
+        return thunk
+    # Continuations are never called with keyword arguments, so wrapped
+    # doesn't take any, which would cost a dict per call:
+    return cast(Callable[_Params, Result], wrapped)
+
+
+def _bounce(thunk:Thunk) -> Result:
+    '''Run thunk and recycle it.'''
+    result = thunk.fn(*thunk.args)
+    # A recycled Thunk must not keep its continuations alive. fn is always
+    # the function that 'tailcall' decorated, which holds on to nothing:
+    thunk.args = ()
+    _thunks.append(thunk)
+    return result
 
 
-@tailcall
 def success(subst:Subst, backtrack:Next) -> Result:
     '''Return the Subst subst and start searching for more Solutions.'''
+    # This does no work of its own, so it returns the solution directly
+    # instead of bouncing once more on the trampoline.
     return subst, backtrack
 
 
@@ -141,35 +361,104 @@ def failure() -> Result:
     '''Fail.'''
 
 
+def _solutions(step:Step) -> Generator[Subst, None, None]:
+    '''Drive step and yield every Subst it succeeds with.'''
+    # Tabled evaluations run on this trampoline, so if an exception escapes,
+    # the ones it interrupted must be dropped:
+    depth = len(_evaluating())
+    recycle = _thunks.append
+    try:
+        result: Result = step(success, failure, failure)
+        while result:
+            if type(result) is Thunk:
+                # This is _bounce, inlined:
+                thunk = result
+                result = thunk.fn(*thunk.args)
+                thunk.args = ()
+                recycle(thunk)
+            else:
+                subst, next = result  # type: ignore
+                yield subst
+                result = next()
+    except BaseException:
+        _abandon(depth)
+        raise
+
+
+@dataclass(slots=True, eq=False)
+class _OnSuccess:
+    '''The success continuation of a bind step.'''
+    goal: Goal
+    succeed: Emit
+    escape: Next
+
+    @tailcall
+    def __call__(self, subst:Subst, backtrack:Next) -> Result:
+        return self.goal(subst)(self.succeed, backtrack, self.escape)
+
+
+@dataclass(slots=True, eq=False)
+class _BindStep:
+    '''The step that applies goal to the results of step.'''
+    step: Step
+    goal: Goal
+
+    @tailcall
+    def __call__(self, succeed:Emit, backtrack:Next, escape:Next) -> Result:
+        on_success = _OnSuccess(self.goal, succeed, escape)
+        return self.step(on_success, backtrack, escape)
+
+
 def bind(step:Step, goal:Goal) -> Step:
     '''Return the result of applying goal to step.'''
+    return _BindStep(step, goal)
+
+
+@dataclass(slots=True, eq=False)
+class _UnitStep:
+    '''The step that succeeds once with subst.'''
+    subst: Subst
+
     @tailcall
-    def mb(succeed:Emit, backtrack:Next, escape:Next) -> Result:
-        @tailcall
-        def on_success(subst:Subst, backtrack:Next) -> Result:
-            return goal(subst)(succeed, backtrack, escape)
-        return step(on_success, backtrack, escape)
-    return mb
+    def __call__(self, succeed:Emit, backtrack:Next, escape:Next) -> Result:
+        return succeed(self.subst, backtrack)
 
 
 def unit(subst:Subst) -> Step:
     '''Take the single value subst into the monad. Represents success.
     Together with 'then', this makes the monad also a monoid. Together
     with 'fail' and 'choice', this makes the monad also a lattice.'''
+    return _UnitStep(subst)
+
+
+@dataclass(slots=True, eq=False)
+class _CutStep:
+    '''The step that succeeds once with subst and then prunes.'''
+    subst: Subst
+
     @tailcall
-    def step(succeed:Emit, backtrack:Next, escape:Next) -> Result:
-        return succeed(subst, backtrack)
-    return step
+    def __call__(self, succeed:Emit, backtrack:Next, escape:Next) -> Result:
+        # we commit to the current execution path by injecting
+        # the escape continuation as our new backtracking path:
+        return succeed(self.subst, escape)
 
 
 def cut(subst:Subst) -> Step:
     '''Succeed, then prune the search tree at the previous choice point.'''
+    return _CutStep(subst)
+
+
+@dataclass(slots=True, eq=False)
+class _FailStep:
+    '''The step that never succeeds.'''
+
     @tailcall
-    def step(succeed:Emit, backtrack:Next, escape:Next) -> Result:
-        # we commit to the current execution path by injecting
-        # the escape continuation as our new backtracking path:
-        return succeed(subst, escape)
-    return step
+    def __call__(self, succeed:Emit, backtrack:Next, escape:Next) -> Result:
+        return backtrack()
+
+
+# Failure doesn't depend on the Subst, so a single step suffices:
+_FAIL_STEP = _FailStep()
 
 
 def fail(subst:Subst) -> Step:
@@ -177,19 +466,98 @@ def fail(subst:Subst) -> Step:
     Together with 'coice', this makes the monad also a monoid. Together
     with 'unit' and 'then', this makes the monad also a lattice.
     It is also mzero.'''
+    return _FAIL_STEP
+
+
+@dataclass(slots=True, eq=False)
+class _ThenStep:
+    '''The step that applies goal1 and goal2 in sequence to subst.'''
+    goal1: Goal
+    goal2: Goal
+    subst: Subst
+
     @tailcall
-    def step(succeed:Emit, backtrack:Next, escape:Next) -> Result:
-        return backtrack()
-    return step
+    def __call__(self, succeed:Emit, backtrack:Next, escape:Next) -> Result:
+        # goal1 is only applied here, and not when the step is created, so
+        # that long chains of 'then' steps don't exhaust the Python stack:
+        on_success = _OnSuccess(self.goal2, succeed, escape)
+        return self.goal1(self.subst)(on_success, backtrack, escape)
+
+
+@dataclass(slots=True, eq=False)
+class _Then:
+    '''The goal that applies goal1 and goal2 in sequence.'''
+    goal1: Goal
+    goal2: Goal
+
+    def __call__(self, subst:Subst) -> Step:
+        return _ThenStep(self.goal1, self.goal2, subst)
 
 
 def then(goal1:Goal, goal2:Goal) -> Goal:
     '''Apply two monadic functions goal1 and goal2 in sequence.
     Together with 'unit', this makes the monad also a monoid. Together
     with 'fail' and 'choice', this makes the monad also a lattice.'''
-    def goal(subst:Subst) -> Step:
-        return bind(goal1(subst), goal2)
-    return goal
+    # 'unit' is the identity element of the monoid:
+    if goal2 is unit:
+        return goal1
+    if goal1 is unit:
+        return goal2
+    # ... and 'fail' is its left zero:
+    if goal1 is fail:
+        return fail
+    return _Then(goal1, goal2)
+
+
+@dataclass(slots=True, eq=False)
+class _OnSeqSuccess:
+    '''The success continuation of the goal at index in a seq step.'''
+    goals: tuple[Goal, ...]
+    index: int
+    succeed: Emit
+    escape: Next
+    # The continuation of the next goal is the same for every solution of
+    # this one, so it is created once and then reused:
+    following: Optional['_OnSeqSuccess'] = None
+
+    @tailcall
+    def __call__(self, subst:Subst, backtrack:Next) -> Result:
+        goals = self.goals
+        index = self.index
+        if index + 1 == len(goals):
+            # the last goal succeeds directly into our own continuation:
+            return goals[index](subst)(self.succeed, backtrack, self.escape)
+        on_success = self.following
+        if on_success is None:
+            on_success = self.following = _OnSeqSuccess(
+                goals, index + 1, self.succeed, self.escape)
+        return goals[index](subst)(on_success, backtrack, self.escape)
+
+
+@dataclass(slots=True, eq=False)
+class _SeqStep:
+    '''The step that applies the goals in sequence to subst.'''
+    goals: tuple[Goal, ...]
+    subst: Subst
+
+    @tailcall
+    def __call__(self, succeed:Emit, backtrack:Next, escape:Next) -> Result:
+        # The first goal is applied right here, so it needs no continuation:
+        goals = self.goals
+        on_success = _OnSeqSuccess(goals, 1, succeed, escape)
+        return goals[0](self.subst)(on_success, backtrack, escape)
+
+
+@dataclass(slots=True, eq=False)
+class _Seq:
+    '''The goal that applies the goals in sequence. Unlike a fold over
+    'then', it keeps them in a flat tuple, so that each solution passes
+    through one continuation per goal instead of a tower of them. There
+    are always at least three goals.'''
+    goals: tuple[Goal, ...]
+
+    def __call__(self, subst:Subst) -> Step:
+        return _SeqStep(self.goals, subst)
 
 
 def seq(*goals:Goal) -> Goal:
@@ -198,28 +566,93 @@ def seq(*goals:Goal) -> Goal:
     return seq.from_iterable(goals)  # type: ignore
 
 
+def _conjoined(goals:Iterable[Goal]) -> Iterable[Goal]:
+    '''Splice the goals of nested 'seq' and 'then' goals into goals, which
+    is legal because sequencing is associative.'''
+    for goal in goals:
+        if type(goal) is _Seq:
+            yield from goal.goals
+        elif type(goal) is _Then:
+            yield goal.goal1
+            yield goal.goal2
+        elif goal is fail:
+            # Nothing after 'fail' is ever reached:
+            yield goal
+            return
+        elif goal is not unit:
+            yield goal
+
+
 @extend(seq)
 def from_iterable(goals:Iterable[Goal]) -> Goal:  # type: ignore
     '''Find solutions for all goals in sequence.'''
-    return reduce(then, goals, unit)  # type: ignore
+    # Short sequences don't need the machinery of a 'seq' goal:
+    match tuple(_conjoined(goals)):
+        case ():
+            return unit
+        case (goal,):
+            return goal
+        case (goal1, goal2):
+            return then(goal1, goal2)
+        case goals:
+            return _Seq(goals)
 del from_iterable
 
 
+@dataclass(slots=True, eq=False)
+class _OnFailure:
+    '''The failure continuation of a choice step.'''
+    goal: Goal
+    subst: Subst
+    mark: int
+    succeed: Emit
+    backtrack: Next
+    escape: Next
+
+    @tailcall
+    def __call__(self) -> Result:
+        # undo the bindings of the failed alternative before we try the next:
+        self.subst.pop_to(self.mark)
+        return self.goal(self.subst)(self.succeed, self.backtrack, self.escape)
+
+
+@dataclass(slots=True, eq=False)
+class _ChoiceStep:
+    '''The step that tries goal1 and then goal2 on subst.'''
+    goal1: Goal
+    goal2: Goal
+    subst: Subst
+
+    @tailcall
+    def __call__(self, succeed:Emit, backtrack:Next, escape:Next) -> Result:
+        # we pass goal and goal2 the same success continuation, so we
+        # can invoke goal and goal2 at the same point in the computation:
+        subst = self.subst
+        on_failure = _OnFailure(
+            self.goal2, subst, len(subst.trail), succeed, backtrack, escape)
+        return self.goal1(subst)(succeed, on_failure, escape)
+
+
+@dataclass(slots=True, eq=False)
+class _Choice:
+    '''The goal that succeeds if either goal1 or goal2 succeeds.'''
+    goal1: Goal
+    goal2: Goal
+
+    def __call__(self, subst:Subst) -> Step:
+        return _ChoiceStep(self.goal1, self.goal2, subst)
+
+
 def choice(goal1:Goal, goal2:Goal) -> Goal:
     '''Succeeds if either of the goal functions succeeds.
     Together with 'fail', this makes the monad also a monoid. Together
     with 'unit' and 'then', this makes the monad also a lattice.'''
-    def goal(subst:Subst) -> Step:
-        @tailcall
-        def step(succeed:Emit, backtrack:Next, escape:Next) -> Result:
-            # we pass goal and goal2 the same success continuation, so we
-            # can invoke goal and goal2 at the same point in the computation:
-            @tailcall
-            def on_failure() -> Result:
-                return goal2(subst)(succeed, backtrack, escape)
-            return goal1(subst)(succeed, on_failure, escape)
-        return step
-    return goal
+    # 'fail' is the identity element of the monoid:
+    if goal2 is fail:
+        return goal1
+    if goal1 is fail:
+        return goal2
+    return _Choice(goal1, goal2)
 
 
 def amb(*goals:Goal) -> Goal:
@@ -228,88 +661,1482 @@ def amb(*goals:Goal) -> Goal:
     return amb.from_iterable(goals)  # type: ignore
 
 
+@dataclass(slots=True, eq=False)
+class _AmbStep:
+    '''The step that tries the joined goals on subst.'''
+    joined: Goal
+    subst: Subst
+
+    @tailcall
+    def __call__(self, succeed:Emit, backtrack:Next, escape:Next) -> Result:
+        # we serialize the goals and inject the
+        # fail continuation as the escape path:
+        joined = self.joined
+        subst = self.subst
+        if type(joined) is _Choice:
+            # This is the top 'choice' step, inlined. With two goals, that's
+            # all of them:
+            on_failure = _OnFailure(
+                joined.goal2, subst, len(subst.trail),
+                succeed, backtrack, backtrack)
+            return joined.goal1(subst)(succeed, on_failure, backtrack)
+        return joined(subst)(succeed, backtrack, backtrack)
+
+
+@dataclass(slots=True, eq=False)
+class _Amb:
+    '''The goal that creates a choice point between the joined goals.'''
+    joined: Goal
+
+    def __call__(self, subst:Subst) -> Step:
+        return _AmbStep(self.joined, subst)
+
+
+def _disjoined(goals:Iterable[Goal]) -> Iterable[Goal]:
+    '''Splice the goals of nested 'amb' goals into goals. Only an 'amb' of
+    unifications qualifies, because a 'cut' in any other goal would prune
+    more alternatives after splicing than before.'''
+    for goal in goals:
+        if type(goal) is _Amb:
+            todo = [goal.joined]
+            alternatives = []
+            while todo:
+                each = todo.pop()
+                if type(each) is _Choice:
+                    todo.append(each.goal2)
+                    todo.append(each.goal1)
+                else:
+                    alternatives.append(each)
+            if all(type(each) is _Unify for each in alternatives):
+                yield from alternatives
+                continue
+        if goal is not fail:
+            yield goal
+
+
+def _balanced(goals:Sequence[Goal]) -> Goal:
+    '''Join goals with 'choice' into a balanced tree instead of a spine, so
+    that every alternative is reached in a logarithmic number of steps.'''
+    # This works because 'choice' is associative. Zipping an iterator with
+    # itself pairs up adjacent goals without slicing copies of goals:
+    while len(goals) > 1:
+        items = iter(goals)
+        joined = [choice(goal1, goal2) for goal1, goal2 in zip(items, items)]
+        if len(goals) % 2:
+            joined.append(goals[-1])
+        goals = joined
+    return goals[0]
+
+
 # pylint: disable=E0102
 @extend(amb)  # type: ignore
 def from_iterable(goals:Iterable[Goal]) -> Goal:
     '''Find solutsons for some goals. This creates a choice point.'''
-    joined = reduce(choice, goals, fail)  # type: ignore
-    def goal(subst:Subst) -> Step:
-        @tailcall
-        def step(succeed:Emit, backtrack:Next, escape:Next) -> Result:
-            # we serialize the goals and inject the
-            # fail continuation as the escape path:
-            return joined(subst)(succeed, backtrack, backtrack)
-        return step
-    return goal
+    # A single goal still needs its own choice point, so that a 'cut' in it
+    # prunes no further than this 'amb', but it needs no 'choice':
+    match tuple(_disjoined(goals)):
+        case ():
+            return fail
+        case (goal,):
+            return _Amb(goal)
+        case goals:
+            return _Amb(_balanced(goals))
 del from_iterable
 
 
+@dataclass(slots=True, eq=False)
+class _Goals:
+    '''The iterator of the goals of a lazy 'amb'. The workers of a 'par_amb'
+    may share it, so only one of them at a time may take goals.'''
+    iterator: Iterator[Goal]
+    lock: Lock = field(default_factory=Lock, repr=False)
+
+
+@dataclass(slots=True, eq=False)
+class _Cell:
+    '''A cell in the linked list of the goals of a lazy 'amb'. Its goal and
+    the next cell are taken from goals when they are first needed. Unless
+    the first cell is kept, only the choice points that can still try a cell
+    refer to it, so the goals that were tried already are dropped, like with
+    an 'itertools.tee'. If there are no more goals, the cell has no next
+    cell.'''
+    goals: _Goals
+    goal: Optional[Goal] = None
+    next: Optional['_Cell'] = None
+    taken: bool = False
+
+    def take(self):
+        '''Take the goal of this cell, unless it was taken already.'''
+        # Another worker may have taken it in the meantime:
+        with self.goals.lock:
+            if self.taken:
+                return
+            for goal in self.goals.iterator:
+                self.goal = goal
+                self.next = _Cell(self.goals)
+                break
+            self.taken = True
+
+
+@dataclass(slots=True, eq=False)
+class _OnStreamFailure:
+    '''The failure continuation of a lazy 'amb', which tries the goal of
+    cell.'''
+    cell: _Cell
+    subst: Subst
+    mark: int
+    succeed: Emit
+    backtrack: Next
+
+    @tailcall
+    def __call__(self) -> Result:
+        subst = self.subst
+        subst.pop_to(self.mark)
+        cell = self.cell
+        if not cell.taken:
+            cell.take()
+        if cell.next is None:
+            return self.backtrack()
+        on_failure = _OnStreamFailure(
+            cell.next, subst, self.mark, self.succeed, self.backtrack)
+        # like in 'amb', the fail continuation is the escape path:
+        return cell.goal(subst)(  # type: ignore
+            self.succeed, on_failure, self.backtrack)
+
+
+@dataclass(slots=True, eq=False)
+class _LazyAmbStep:
+    '''The step that tries the goals from goals on subst, starting with the
+    goal of head, if there is one.'''
+    goals: Iterable[Goal]
+    head: Optional[_Cell]
+    subst: Subst
+
+    @tailcall
+    def __call__(self, succeed:Emit, backtrack:Next, escape:Next) -> Result:
+        subst = self.subst
+        head = self.head or _Cell(_Goals(iter(self.goals)))
+        first = _OnStreamFailure(
+            head, subst, len(subst.trail), succeed, backtrack)
+        return first()
+
+
+@dataclass(slots=True, eq=False)
+class _LazyAmb:
+    '''The goal that creates a choice point between the goals from goals.
+    If goals is an iterator, head is the first cell of the goals taken from
+    it, from which every call of the goal starts.'''
+    goals: Iterable[Goal]
+    head: Optional[_Cell]
+
+    def __call__(self, subst:Subst) -> Step:
+        return _LazyAmbStep(self.goals, self.head, subst)
+
+
+@extend(amb)  # type: ignore
+def lazy(goals:Iterable[Goal]) -> Goal:
+    '''Find solutions for some goals like 'amb.from_iterable', but take each
+    goal from goals only when the previous ones have been exhausted, so that
+    goals can be expensive to construct, or infinite. If goals can be
+    iterated more than once, like a list, it is iterated anew each time the
+    goal is tried, and the goals that were tried are not kept. An iterator
+    can only be iterated once, so the goals taken from it are kept, and are
+    tried again when the goal is tried again, e.g. after backtracking.'''
+    iterator = iter(goals)
+    if iterator is goals:
+        return _LazyAmb(goals, _Cell(_Goals(iterator)))
+    return _LazyAmb(goals, None)
+del lazy
+
+
+def _cuts(goal:Goal) -> bool:
+    '''Check whether a 'cut' in goal prunes the choice point that goal is
+    an alternative of. A 'cut' inside of a nested 'amb', 'no' or 'par_amb'
+    only prunes that. The bodies of predicates can't be inspected before
+    they are resolved, so a call of a predicate is assumed to cut, and so is
+    any other function, since it might reach a 'cut' through its globals.
+    Tabled predicates never cut, because their answers are computed in an
+    evaluation of their own.'''
+    seen = set()
+    todo = [goal]
+    while todo:
+        obj = todo.pop()
+        if obj is unit or obj is fail or id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        match obj:
+            case _Then() | _Choice():
+                todo.extend((obj.goal1, obj.goal2))
+            case _Seq():
+                todo.extend(obj.goals)
+            case _Compiled():
+                if _cuts_compiled(obj.program, todo):
+                    return True
+            case (_Amb() | _LazyAmb() | _No() | _ParAmb() | _TableCall()
+                  | _Unify() | _Condition() | _Guard()):
+                pass
+            case _:
+                return True
+    return False
+
+
+def _cuts_compiled(program:tuple[tuple, tuple, int], todo:list) -> bool:
+    '''Check whether the compiled program contains a 'cut' or a call that
+    prunes to the mark of its caller, which is in slot 0. Add the opaque
+    goals that would prune there to todo.'''
+    code, consts, _ = program
+    for pc in range(0, len(code), 2):
+        op, arg = code[pc], code[pc + 1]
+        if op == _Op.CUT and arg == 0:
+            return True
+        if op in (_Op.CALL, _Op.TAILCALL) and consts[arg][-1] == 0:
+            return True
+        if op == _Op.INVOKE and consts[arg][-1] == 0:
+            todo.append(consts[arg][0])
+    return False
+
+
+# How long a worker of 'par_amb' waits for room in the queue of answers
+# before it checks again whether it should stop:
+_POLL_INTERVAL = 0.05
+
+
+def _offer(answers:Queue, item, stop:Event) -> bool:
+    '''Put item into answers as soon as there is room, unless stop is set
+    first. Return whether item was put.'''
+    while not stop.is_set():
+        try:
+            answers.put(item, timeout=_POLL_INTERVAL)
+            return True
+        except Full:
+            pass
+    return False
+
+
+def _work(todo:SimpleQueue, answers:Queue, stop:Event):
+    '''Take goals and Substs from todo, resolve them, and put the answers
+    into answers, followed by None for each goal, until todo is empty or stop
+    is set. An exception is put into answers instead.'''
+    while not stop.is_set():
+        try:
+            goal, subst = todo.get_nowait()
+        except Empty:
+            return
+        try:
+            for each in _solutions(goal(subst)):
+                # every answer is cloned before the worker backtracks and
+                # changes it:
+                if not _offer(answers, each.clone(), stop):
+                    return
+        except BaseException as exc:  # pylint: disable=W0718
+            _offer(answers, exc, stop)
+            return
+        if not _offer(answers, None, stop):
+            return
+
+
+@dataclass(slots=True, eq=False)
+class _Drain:
+    '''The failure continuation of a par_amb step, which succeeds with the
+    next answer of the workers.'''
+    answers: Queue
+    stop: Event
+    pending: int
+    succeed: Emit
+    backtrack: Next
+
+    def __del__(self):
+        # If we are dropped before all answers were taken, because of a 'cut'
+        # or because the resolution was abandoned, the workers must stop:
+        self.stop.set()
+
+    @tailcall
+    def __call__(self) -> Result:
+        while self.pending:
+            answer = self.answers.get()
+            if answer is None:
+                self.pending -= 1
+            elif isinstance(answer, BaseException):
+                self.stop.set()
+                raise answer
+            else:
+                return self.succeed(answer, self)
+        self.stop.set()
+        return self.backtrack()
+
+
+@dataclass(slots=True, eq=False)
+class _ParAmbStep:
+    '''The step that resolves goals on clones of subst in worker threads.'''
+    goals: tuple[Goal, ...]
+    workers: int
+    fallback: Goal
+    subst: Subst
+
+    @tailcall
+    def __call__(self, succeed:Emit, backtrack:Next, escape:Next) -> Result:
+        if _evaluating():
+            # Tabled evaluation holds a lock that the workers would wait for,
+            # while we wait for them:
+            return self.fallback(self.subst)(succeed, backtrack, escape)
+        todo: SimpleQueue = SimpleQueue()
+        for goal in self.goals:
+            todo.put((goal, self.subst.clone()))
+        # The queue is bounded, so that workers don't run ahead of us:
+        answers: Queue = Queue(self.workers)
+        stop = Event()
+        # The threads are daemons, so that stopped workers that still finish
+        # a goal without solutions don't keep the interpreter from exiting:
+        for _ in range(min(self.workers, len(self.goals))):
+            worker = Thread(target=_work, args=(todo, answers, stop))
+            worker.daemon = True
+            worker.start()
+        return _Drain(answers, stop, len(self.goals), succeed, backtrack)()
+
+
+@dataclass(slots=True, eq=False)
+class _ParAmb:
+    '''The goal that resolves goals concurrently, or like fallback while
+    that isn't possible.'''
+    goals: tuple[Goal, ...]
+    workers: int
+    fallback: Goal
+
+    def __call__(self, subst:Subst) -> Step:
+        return _ParAmbStep(self.goals, self.workers, self.fallback, subst)
+
+
+def par_amb(*goals:Goal, workers:Optional[int]=None) -> Goal:
+    '''Find solutions for some goals like 'amb', but resolve the goals
+    concurrently in up to workers threads, which are started each time it
+    is resolved. Solutions are produced in the order in which they are
+    found. Since a 'cut' in one goal can't prune the others, fall back to
+    'amb' if any goal might contain a 'cut', which includes calls of
+    predicates and plain functions. The workers are stopped when no more
+    solutions are asked for.'''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    elif workers < 1:
+        raise ValueError(f'workers must be at least 1, not {workers}')
+    if any(map(_cuts, goals)):
+        return amb(*goals)
+    return _ParAmb(goals, workers, amb(*goals))
+
+
+@dataclass(slots=True, eq=False)
+class _OnNoSuccess:
+    '''The success continuation of the goal of a negation step.'''
+    mark: int
+    backtrack: Next
+
+    @tailcall
+    def __call__(self, subst:Subst, backtrack:Next) -> Result:
+        # the first solution is enough, so we drop the choice points of the
+        # goal, undo its bindings and fail:
+        subst.pop_to(self.mark)
+        return self.backtrack()
+
+
+@dataclass(slots=True, eq=False)
+class _OnNoFailure:
+    '''The failure continuation of the goal of a negation step.'''
+    subst: Subst
+    mark: int
+    succeed: Emit
+    backtrack: Next
+
+    @tailcall
+    def __call__(self) -> Result:
+        self.subst.pop_to(self.mark)
+        return self.succeed(self.subst, self.backtrack)
+
+
+@dataclass(slots=True, eq=False)
+class _NoStep:
+    '''The step that succeeds once with subst if goal fails on it.'''
+    goal: Goal
+    subst: Subst
+
+    @tailcall
+    def __call__(self, succeed:Emit, backtrack:Next, escape:Next) -> Result:
+        # like in an 'amb', a 'cut' in goal escapes to our own failure:
+        subst = self.subst
+        mark = len(subst.trail)
+        on_failure = _OnNoFailure(subst, mark, succeed, backtrack)
+        on_success = _OnNoSuccess(mark, backtrack)
+        return self.goal(subst)(on_success, on_failure, backtrack)
+
+
+@dataclass(slots=True, eq=False)
+class _No:
+    '''The goal that succeeds if goal fails.'''
+    goal: Goal
+
+    def __call__(self, subst:Subst) -> Step:
+        return _NoStep(self.goal, subst)
+
+
 def no(goal:Goal) -> Goal:
     '''Invert the result of a monadic computation, AKA negation as failure.'''
-    return amb(seq(goal, cut, fail), unit)
+    # This means 'amb(seq(goal, cut, fail), unit)', but it stops after the
+    # first solution of goal without going through the cut and fail steps:
+    return _No(goal)
 
 
-def compatible(this, that):
-    '''Only sequences of same type and length are compatible in unification.'''
-    # pylint: disable=C0123
-    return type(this) == type(that) and len(this) == len(that)
+def _bind_that(subst:Subst, this, that) -> bool:
+    '''Bind the Variable that to this.'''
+    subst.assign(that, this)
+    return True
 
 
-def _unify(this, that):
-    match this, that:
-        case _ if this == that:
-            # Equal things are already unified:
-            return unit
-        case list() | tuple(), list() | tuple() if compatible(this, that):
-            # Two lists or tuples are unified only if their elements are also:
-            # pylint: disable=E1101
-            return seq.from_iterable(map(unify, this, that))
-        case Variable(), _:
-            # Bind a Variable to another thing:
-            return lambda subst: unit(subst.new_child({this: that}))
-        case _, Variable():
-            # Same as above, but with swapped arguments:
-            return lambda subst: unit(subst.new_child({that: this}))
-        case _:
-            # Unification failed:
-            return fail
+def _unify_items(subst:Subst, this, that) -> bool:
+    '''Unify the items of two lists or tuples of the same type.'''
+    return len(this) == len(that) and _unify_all(subst, zip(this, that))
+
+
+def _unify_equal(subst:Subst, this, that) -> bool:
+    '''Unify this and that if they are equal.'''
+    return this == that
+
+
+def _unifier(this_type:type, that_type:type) -> Callable[..., bool]:
+    '''Choose the function that unifies objects of the given types, where
+    the first one isn't Variable.'''
+    if that_type is Variable:
+        return _bind_that
+    if this_type is that_type and issubclass(this_type, (list, tuple)):
+        # Only sequences of same type and length are compatible. Others, like
+        # a named tuple and a plain tuple, are unified if they are equal:
+        return _unify_items
+    return _unify_equal
 
 
-# Public interface to _unify:
+# The unifiers of the pairs of types seen so far, as a dict of dicts, since
+# two lookups by type are faster than hashing a new tuple of both types:
+_unifiers: dict[type, dict[type, Callable[..., bool]]] = {}
+
+
+def _unify_all(subst:Subst, pairs:Iterable[tuple[Any, Any]]) -> bool:
+    '''Unify each pair in pairs by binding Variables in subst. Return
+    whether unification succeeded.'''
+    deref = subst.deref
+    unifiers = _unifiers
+    # Instead of recursing into lists and tuples, we keep a stack of the
+    # iterators over the pairs of the enclosing sequences, so that deeply
+    # nested terms don't exhaust the Python stack. The ids of the pairs of
+    # sequences that were unified are kept, because Variables bound to
+    # terms that contain them make cyclic terms, which would be unified
+    # forever:
+    pairs = iter(pairs)
+    stack: list[Iterator[tuple[Any, Any]]] = []
+    seen: set[tuple[int, int]] = set()
+    while True:
+        for this, that in pairs:
+            # Atoms and identical things don't need to be dereferenced, so
+            # we save the calls of deref for them:
+            if this is that:
+                continue
+            if type(this) is Variable:
+                this = deref(this)
+            if type(that) is Variable:
+                that = deref(that)
+            if this is that:
+                # Identical things are already unified:
+                continue
+            if type(this) is Variable:
+                # Binding a Variable is by far the most frequent case, so we
+                # do it right here:
+                if type(that) is not Variable or this.id != that.id:
+                    subst.assign(this, that)
+                continue
+            # Otherwise, dispatch on the pair of types through a cache, which
+            # is faster than a ladder of type checks:
+            try:
+                unifier = unifiers[type(this)][type(that)]
+            except KeyError:
+                unifier = _unifier(type(this), type(that))
+                unifiers.setdefault(type(this), {})[type(that)] = unifier
+            if unifier is _unify_items:
+                if len(this) != len(that):
+                    return False
+                pair = id(this), id(that)
+                if pair in seen:
+                    # This pair is already unified, or is being unified:
+                    continue
+                seen.add(pair)
+                stack.append(pairs)
+                pairs = zip(this, that)
+                break
+            if not unifier(subst, this, that):
+                return False
+        else:
+            if not stack:
+                return True
+            pairs = stack.pop()
+
+
+def _unify_pairs(subst:Subst, pairs) -> bool:
+    '''Unify each pair in pairs. Return whether unification succeeded. If
+    it didn't, subst is left as it was.'''
+    mark = len(subst.trail)
+    if _unify_all(subst, pairs):
+        return True
+    subst.pop_to(mark)
+    return False
+
+
+def _is_atom(obj) -> bool:
+    '''Check whether obj is neither a Variable nor a list or tuple.'''
+    return type(obj) is not Variable and not isinstance(obj, (list, tuple))
+
+
+def _assign_pairs(subst:Subst, pairs) -> bool:
+    '''Like _unify_pairs, but for pairs of a Variable and an atom, which
+    need neither the dispatch on types nor the walk into sequences.'''
+    mark = len(subst.trail)
+    deref = subst.deref
+    for variable, atom in pairs:
+        value = deref(variable)
+        if type(value) is Variable:
+            subst.assign(value, atom)
+        elif value is not atom and (not _is_atom(value) or value != atom):
+            subst.pop_to(mark)
+            return False
+    return True
+
+
+@dataclass(slots=True, eq=False)
+class _Unify:
+    '''The goal that unifies each pair in pairs.'''
+    pairs: tuple
+    # Either _unify_pairs or, if it suffices, _assign_pairs:
+    unifier: Callable[[Subst, tuple], bool] = _unify_pairs
+
+    def __call__(self, subst:Subst) -> Step:
+        if self.unifier(subst, self.pairs):
+            return _UnitStep(subst)
+        return _FAIL_STEP
+
+
+# Public interface to _unify_all:
 def unify(*pairs:tuple[Any, Any]) -> Goal:
     '''Unify 'this' and 'that'.
     If at least one is an unbound Variable, bind it to the other object.
     If both are either lists or tuples, try to unify them recursively.
     Otherwise, unify them if they are equal.'''
-    # pylint: disable=E1101,W0108
-    return lambda subst: seq.from_iterable(  # type: ignore
-        _unify(subst.deref(this), subst.deref(that)) for this, that in pairs
-    )(subst)
+    # Goals can't be shared between calls with equal pairs, because equal
+    # atoms aren't necessarily interchangeable, but they can be made cheaply.
+    # A plain loop is faster than 'all' over a generator:
+    for this, that in pairs:
+        if (type(this) is not Variable or type(that) is Variable
+                or isinstance(that, (list, tuple))):
+            return _Unify(pairs)
+    return _Unify(pairs, _assign_pairs)
 
 
 def unify_any(var:Variable, *values) -> Goal:
     ''' Tries to unify a variable with any one of objects.
     Fails if no object is unifiable.'''
+    if len(values) == 1:
+        # There's no 'cut' in 'unify', so it needs no choice point:
+        return unify((var, values[0]))
      # pylint: disable=E1101
-    return amb.from_iterable(unify((var, value)) for value in values)  # type: ignore
+    if type(var) is not Variable:
+        return amb.from_iterable(  # type: ignore
+            unify((var, value)) for value in values)
+    # Here, we already know that each goal binds a Variable:
+    return amb.from_iterable(  # type: ignore
+        _Unify(((var, value),), _assign_pairs if _is_atom(value)
+               else _unify_pairs)
+        for value in values)
+
+
+@dataclass(slots=True, eq=False)
+class _Predicate:
+    '''The goal that resolves the body of a predicate.'''
+    func: Callable[..., Goal]
+    args: tuple
+    kwargs: dict
+
+    def __call__(self, subst:Subst) -> Step:
+        return self.func(*self.args, **self.kwargs)(subst)
+
+
+# The keyword arguments of a call with positional arguments only. It is
+# shared by all such calls and must never be changed:
+_NO_KWARGS: dict = {}
+
+
+# The factories of the wrappers that _positional generates, by the names of
+# the parameters they take, and whether they also pass on keyword arguments:
+_wrapper_factories: dict[tuple[tuple[str, ...], bool], Callable] = {}
+
+
+def _positional(func:Callable, make:Callable[..., Goal], target:Any,
+                with_kwargs:bool=False) -> Optional[Callable[..., Goal]]:
+    '''Generate a wrapper for func with the same fixed parameters, which
+    packs the arguments of a call into make(target, args), or, if
+    with_kwargs, into make(target, args, kwargs), without going through
+    *args and **kwargs. Return None if func's parameters aren't fixed.'''
+    # Reading the code object is much cheaper than 'inspect.signature':
+    if type(func) is not FunctionType or func.__defaults__:
+        return None
+    code = func.__code__
+    if (code.co_flags & (CO_VARARGS | CO_VARKEYWORDS)
+            or code.co_posonlyargcount or code.co_kwonlyargcount):
+        return None
+    names = code.co_varnames[:code.co_argcount]
+    # The source of a wrapper only depends on the names of the parameters, so
+    # it is compiled once for each of them into a factory, which then only
+    # has to bind make and target:
+    factory = _wrapper_factories.get((names, with_kwargs))
+    if factory is None:
+        if {'make', 'target', 'kwargs'} & set(names):
+            return None
+        params = ''.join(f'{name}, ' for name in names)
+        rest = ', kwargs' if with_kwargs else ''
+        namespace: dict = {}
+        exec(  # pylint: disable=W0122
+            f'def factory(make, target):\n'
+            f'    def pred({params}):\n'
+            f'        return make(target, ({params}){rest})\n'
+            f'    return pred\n',
+            {'kwargs': _NO_KWARGS},
+            namespace)
+        factory = namespace['factory']
+        _wrapper_factories[names, with_kwargs] = factory
+    return factory(make, target)
+
+
+def _binder(func:Callable) -> Callable[[tuple, dict], tuple]:
+    '''Return a function that turns the arguments of a call of func, whether
+    given by position or by keyword, into positional ones. Parameters that are left
+    out get their defaults. Keyword-only parameters can't be bound like
+    this, so a call that needs them raises TypeError.'''
+    params = signature(func)
+
+    def bind(args:tuple, kwargs:dict) -> tuple:
+        bound = params.bind(*args, **kwargs)
+        bound.apply_defaults()
+        if bound.kwargs:
+            raise TypeError(
+                f'{func.__name__}() can\'t be called with keyword-only '
+                f'arguments: {", ".join(bound.kwargs)}')
+        return bound.args
+
+    return bind
+
+
+def _named(pred:Callable[..., Goal], func:Callable) -> Callable[..., Goal]:
+    '''Give pred the name and docstring of func. Unlike 'wraps', this
+    copies neither func's __dict__ nor a __wrapped__ reference to func.'''
+    for name in ('__module__', '__name__', '__qualname__', '__doc__'):
+        try:
+            setattr(pred, name, getattr(func, name))
+        except AttributeError:
+            pass
+    return pred
 
 
 def predicate(func:Callable[..., Goal]) -> Callable[..., Goal]:
     '''Helper decorator for backtrackable functions.'''
     # All this does is to create another level of indirection.
-    @wraps(func)
-    def pred(*args, **kwargs) -> Goal:
-        def goal(subst:Subst) -> Step:
-            return func(*args, **kwargs)(subst)
-        return goal
-    return pred
+    pred = _positional(func, _Predicate, func, with_kwargs=True)
+    if pred is None:
+        def pred(*args, **kwargs) -> Goal:
+            return _Predicate(func, args, kwargs)
+    return _named(pred, func)
 
 
-def resolve(goal:Goal) -> Iterable[Mapping]:
-    '''Start the logical resolution of 'goal'. Return all solutions.'''
-    result: Result = goal(Subst())(success, failure, failure)
+@dataclass(slots=True, eq=False)
+class _Condition:
+    '''The goal that succeeds once if test holds for the values of args and
+    kwargs.'''
+    test: Callable[..., bool]
+    args: tuple
+    kwargs: dict
+
+    def __call__(self, subst:Subst) -> Step:
+        args = map(subst.smooth, self.args)
+        if self.kwargs:
+            kwargs = {name: subst.smooth(value)
+                      for name, value in self.kwargs.items()}
+            holds = self.test(*args, **kwargs)
+        else:
+            holds = self.test(*args)
+        if holds:
+            return _UnitStep(subst)
+        return _FAIL_STEP
+
+
+def condition(test:Callable[..., bool]) -> Callable[..., Goal]:
+    '''Decorator for predicates that are plain tests on the values of their
+    arguments, like comparisons. The test is called with the smoothed
+    arguments, in which unbound Variables remain Variables. It doesn't
+    return a goal, but whether the predicate holds.'''
+    pred = _positional(test, _Condition, test, with_kwargs=True)
+    if pred is None:
+        def pred(*args, **kwargs) -> Goal:
+            return _Condition(test, args, kwargs)
+    return _named(pred, test)
+
+
+@dataclass(slots=True, eq=False)
+class _Guard:
+    '''The goal that succeeds once if test holds for the bindings.'''
+    test: Callable[[Mapping], bool]
+
+    def __call__(self, subst:Subst) -> Step:
+        # The test only looks at the bindings while it runs, so it gets a
+        # view of subst instead of a snapshot:
+        if self.test(_Proxy(subst)):
+            return _UnitStep(subst)
+        return _FAIL_STEP
+
+
+def guard(test:Callable[[Mapping], bool]) -> Goal:
+    '''Succeed once if test holds for the current bindings, else fail. This
+    prunes an alternative before any more of it is resolved, if it is
+    already known to be futile. The test is called with a Mapping from
+    Variables to their values, which is only valid during the call.'''
+    return _Guard(test)
+
+
+@dataclass(slots=True, unsafe_hash=True)
+class _Atom:
+    '''An atom in a skeleton. Its type is part of it, because atoms of
+    different types, like 1, 1.0 and True, can be equal, but don't unify.'''
+    kind: type
+    value: Any
+
+
+def _variant(obj, renaming:dict):
+    '''Return a hashable skeleton of the smoothed object obj. Variables are
+    numbered in order of their first occurrence, so that variant terms, i.e.
+    terms that are equal up to the renaming of Variables, have equal
+    skeletons.'''
+    if type(obj) is Variable:
+        return Variable, renaming.setdefault(obj, len(renaming))
+    if not isinstance(obj, (list, tuple)):
+        return _Atom(type(obj), obj)
+    # Like in smooth, nested lists and tuples are walked with a stack of
+    # frames instead of recursively:
+    stack: list[tuple[type, Iterator, list]] = [(type(obj), iter(obj), [])]
+    while True:
+        kind, items, done = stack[-1]
+        for item in items:
+            if type(item) is Variable:
+                number = renaming.setdefault(item, len(renaming))
+                done.append((Variable, number))
+            elif isinstance(item, (list, tuple)):
+                stack.append((type(item), iter(item), []))
+                break
+            else:
+                done.append(_Atom(type(item), item))
+        else:
+            stack.pop()
+            skeleton = kind, tuple(done)
+            if not stack:
+                return skeleton
+            stack[-1][2].append(skeleton)
+
+
+def _instantiate(skeleton, variables:dict):
+    '''Rebuild a term from its skeleton, with fresh Variables.'''
+    # Atoms are wrapped in the skeleton, and everything else became a tagged
+    # tuple, so any tuple found here is such a tagged tuple:
+    if type(skeleton) is _Atom:
+        return skeleton.value
+    kind, body = skeleton
+    if kind is Variable:
+        if body not in variables:
+            variables[body] = var()
+        return variables[body]
+    stack: list[tuple[type, Iterator, list]] = [(kind, iter(body), [])]
+    while True:
+        kind, items, done = stack[-1]
+        for item in items:
+            if type(item) is _Atom:
+                done.append(item.value)
+                continue
+            tag, body = item
+            if tag is not Variable:
+                stack.append((tag, iter(body), []))
+                break
+            if body not in variables:
+                variables[body] = var()
+            done.append(variables[body])
+        else:
+            stack.pop()
+            term = _rebuild(kind, done)
+            if not stack:
+                return term
+            stack[-1][2].append(term)
+
+
+@dataclass(slots=True, eq=False)
+class _Table:
+    '''The table of the answers of a tabled predicate func, by the skeletons
+    of its call variants.'''
+    func: Callable[..., Goal]
+    entries: dict = field(default_factory=dict)
+
+
+@dataclass(slots=True, eq=False)
+class _Entry:
+    '''The table entry of a call variant of a tabled predicate. Its answers
+    are pairs of a skeleton and, if the answer has no Variables, the answer
+    itself, which can then be replayed without being instantiated. When the
+    entry is complete, they are a tuple.'''
+    table: _Table
+    key: Any
+    index: int
+    answers: list|tuple = field(default_factory=list)
+    seen: set = field(default_factory=set)
+    leader: int = 0
+    consumed: bool = False
+    complete: bool = False
+
+
+# Tabled evaluation is serialized, because the goals of 'par_amb' run in
+# threads. The lock is held from the start of the evaluation of a call variant
+# until it is complete:
+_tabling = RLock()
+_local = local()
+
+
+def _evaluating() -> list[_Entry]:
+    '''Return the entries of all call variants that are currently being
+    evaluated in this thread, innermost last.'''
+    try:
+        return _local.evaluating
+    except AttributeError:
+        evaluating = _local.evaluating = []
+        return evaluating
+
+
+def _abandon(depth:int):
+    '''Drop the evaluations in this thread that were started after there
+    were depth of them. This is necessary if an exception interrupted them.'''
+    evaluating = _evaluating()
+    while len(evaluating) > depth:
+        entry = evaluating.pop()
+        entries = entry.table.entries
+        if entries.get(entry.key) is entry:
+            del entries[entry.key]
+        _tabling.release()
+
+
+@dataclass(slots=True, eq=False)
+class _OnReplayFailure:
+    '''The failure continuation of a replay step, which unifies args with
+    the next answer from index on that fits.'''
+    args: tuple
+    answers: tuple
+    index: int
+    subst: Subst
+    mark: int
+    succeed: Emit
+    backtrack: Next
+
+    @tailcall
+    def __call__(self) -> Result:
+        args = self.args
+        answers = self.answers
+        subst = self.subst
+        subst.pop_to(self.mark)
+        # Instead of building a goal for each answer, we try the answers in
+        # a loop, and only return to the trampoline with a solution:
+        for index in range(self.index, len(answers)):
+            answer, term = answers[index]
+            term = term or _instantiate(answer, {})
+            if _unify_pairs(subst, zip(args, term)):
+                on_failure = _OnReplayFailure(
+                    args, answers, index + 1, subst, self.mark,
+                    self.succeed, self.backtrack)
+                return self.succeed(subst, on_failure)
+        return self.backtrack()
+
+
+@dataclass(slots=True, eq=False)
+class _OnTableAnswer:
+    '''The success continuation of the body of a tabled predicate, which
+    adds each answer not seen before to entry.'''
+    entry: _Entry
+    args: tuple
+
+    @tailcall
+    def __call__(self, subst:Subst, backtrack:Next) -> Result:
+        term = subst.smooth(self.args)
+        renaming: dict = {}
+        answer = _variant(term, renaming)
+        entry = self.entry
+        if answer not in entry.seen:
+            entry.seen.add(answer)
+            answers: list = entry.answers  # type: ignore
+            answers.append((answer, None if renaming else term))
+        return backtrack()
+
+
+@dataclass(slots=True, eq=False)
+class _OnTableExhausted:
+    '''The failure continuation of the body of a tabled predicate, which
+    either starts another round of evaluation, or completes the entry and
+    replays its answers to the caller.'''
+    entry: _Entry
+    found: int
+    args: tuple
+    subst: Subst
+    succeed: Emit
+    backtrack: Next
+
+    @tailcall
+    def __call__(self) -> Result:
+        entry = self.entry
+        if entry.consumed and len(entry.answers) != self.found:
+            # A recursive variant call consumed answers of this round, so the
+            # evaluation must be repeated with all the answers found in it:
+            return _evaluate(
+                entry, self.args, self.subst, self.succeed, self.backtrack)
+        evaluating = _evaluating()
+        evaluating.pop()
+        _tabling.release()
+        if entry.leader == entry.index:
+            entry.complete = True
+            answers = entry.answers = tuple(entry.answers)
+        else:
+            # The answers depend on the incomplete answers of a call that is
+            # still being evaluated, so they can't be reused. Unless the table
+            # was reset in the meantime, its entry is still there:
+            entries = entry.table.entries
+            if entries.get(entry.key) is entry:
+                del entries[entry.key]
+            parent = evaluating[-1]
+            parent.leader = min(parent.leader, entry.leader)
+            answers = tuple(entry.answers)
+        subst = self.subst
+        return _OnReplayFailure(
+            self.args, answers, 0, subst, len(subst.trail),
+            self.succeed, self.backtrack)()
+
+
+def _evaluate(entry:_Entry, args:tuple, subst:Subst,
+              succeed:Emit, backtrack:Next) -> Result:
+    '''Run a round of the evaluation of entry, by resolving the body of its
+    predicate for the arguments rebuilt from its key. Then replay the
+    answers to args in subst.'''
+    # The body is resolved on the same trampoline as the call, so that deep
+    # chains of tabled calls don't exhaust the Python stack:
+    entry.consumed = False
+    params = _instantiate(entry.key, {})
+    on_answer = _OnTableAnswer(entry, params)
+    on_exhausted = _OnTableExhausted(
+        entry, len(entry.answers), args, subst, succeed, backtrack)
+    body = entry.table.func(*params)
+    return body(Subst())(on_answer, on_exhausted, on_exhausted)
+
+
+@dataclass(slots=True, eq=False)
+class _TableStep:
+    '''The step that replays the answers in table for the call variant of
+    args in subst, after evaluating them if necessary.'''
+    table: _Table
+    args: tuple
+    subst: Subst
+
+    @tailcall
+    def __call__(self, succeed:Emit, backtrack:Next, escape:Next) -> Result:
+        args = self.args
+        subst = self.subst
+        key = _variant(subst.smooth(args), {})
+        _tabling.acquire()
+        table = self.table
+        try:
+            entry = table.entries.get(key)
+        except TypeError:
+            # The arguments aren't hashable. No entry was made for them, so
+            # nothing would ever release the lock:
+            _tabling.release()
+            raise
+        if entry is None:
+            # The lock stays acquired until the evaluation is complete:
+            evaluating = _evaluating()
+            entry = table.entries[key] = _Entry(table, key, len(evaluating))
+            entry.leader = entry.index
+            evaluating.append(entry)
+            return _evaluate(entry, args, subst, succeed, backtrack)
+        _tabling.release()
+        if entry.complete:
+            answers = entry.answers
+        else:
+            # A recursive variant call, which only consumes the answers
+            # found so far:
+            entry.consumed = True
+            top = _evaluating()[-1]
+            top.leader = min(top.leader, entry.index)
+            answers = tuple(entry.answers)
+        return _OnReplayFailure(
+            args, answers, 0, subst, len(subst.trail), succeed, backtrack)()
+
+
+@dataclass(slots=True, eq=False)
+class _TableCall:
+    '''The goal that replays the answers in table for the call variant of
+    args.'''
+    table: _Table
+    args: tuple
+
+    def __call__(self, subst:Subst) -> Step:
+        return _TableStep(self.table, self.args, subst)
+
+
+def tabled(func:Callable[..., Goal]) -> Callable[..., Goal]:
+    '''Decorator for tabled predicates. The answers to a call are computed
+    once for each call variant and are stored in a table, from which they are
+    replayed on later calls. A recursive variant call consumes the answers
+    found so far, and the evaluation is repeated until no new answers turn
+    up, so that left-recursive predicates terminate. Arguments may be passed
+    by keyword, but func must not have keyword-only parameters.'''
+    table = _Table(func)
+    pred = _positional(func, _TableCall, table)
+    if pred is None:
+        bind = _binder(func)
+
+        def pred(*args, **kwargs) -> Goal:
+            # The variant of a call must not depend on how its arguments
+            # were passed, or whether defaults were left out:
+            return _TableCall(table, bind(args, kwargs))
+    pred.table = table.entries  # type: ignore
+    return _named(pred, func)
+
+
+# Memoized predicates are tabled, so that they too may call themselves with a
+# variant of a call that is still being evaluated:
+memoized = tabled
+
+
+def reset_table(pred:Callable[..., Goal]):
+    '''Forget all answers stored for the tabled predicate pred.'''
+    with _tabling:
+        pred.table.clear()  # type: ignore
+
+
+class _Op(IntEnum):
+    '''The opcodes of the virtual machine that runs compiled goals. Each
+    instruction consists of an opcode and a single integer argument.'''
+    # Start backtracking:
+    FAIL = 0
+    # Continue at the address given by the argument:
+    JUMP = 1
+    # Push a choice point that continues at the address given by the argument:
+    TRY = 2
+    # Remember the number of choice points in the slot given by the argument:
+    MARK = 3
+    # Drop all choice points younger than the mark in the given slot:
+    CUT = 4
+    # Unify the pairs in the given constant with the unifier paired with them:
+    UNIFY = 5
+    # Compile and run the body of the predicate in the given constant:
+    CALL = 6
+    # Resolve the opaque goal in the given constant:
+    INVOKE = 7
+    # Return to the caller, or emit a solution if there is none:
+    RET = 8
+    # Like CALL, but the body returns directly to the caller of the caller:
+    TAILCALL = 9
+
+
+def _conjuncts(goal:Goal) -> Iterable[Goal]:
+    '''Flatten a tree of 'then' and 'seq' goals into the sequence of its
+    leaves.'''
+    todo = [goal]
+    while todo:
+        goal = todo.pop()
+        if type(goal) is _Then:
+            todo.append(goal.goal2)
+            todo.append(goal.goal1)
+        elif type(goal) is _Seq:
+            todo.extend(reversed(goal.goals))
+        elif goal is not unit:
+            yield goal
+
+
+def _disjuncts(goal:Goal) -> Iterable[Goal]:
+    '''Flatten a tree of 'choice' goals into the sequence of its leaves.'''
+    todo = [goal]
+    while todo:
+        goal = todo.pop()
+        if type(goal) is _Choice:
+            todo.append(goal.goal2)
+            todo.append(goal.goal1)
+        elif goal is not fail:
+            yield goal
+
+
+def _flatten(goal:Goal) -> tuple[tuple, list]:
+    '''Return the shape of goal, which is the sequence of the kinds of its
+    nodes in pre-order, and the values at its leaves that become constants
+    of the compiled code, in the same order.'''
+    shape: list = []
+    leaves: list[tuple] = []
+    todo: list[Any] = [goal]
+    while todo:
+        node = todo.pop()
+        kind = type(node)
+        if kind is _Then or kind is _Choice:
+            shape.append(kind)
+            todo.append(node.goal2)
+            todo.append(node.goal1)
+        elif kind is _Seq:
+            # The number of goals is part of the shape:
+            shape.append(len(node.goals))
+            todo.extend(reversed(node.goals))
+        elif kind is _Amb:
+            shape.append(kind)
+            todo.append(node.joined)
+        elif kind is _No:
+            shape.append(kind)
+            todo.append(node.goal)
+        elif kind is _Unify:
+            shape.append(kind)
+            leaves.append((node.unifier, node.pairs))
+        elif kind is _Predicate:
+            shape.append(kind)
+            leaves.append((node.func, node.args, node.kwargs))
+        elif node is unit or node is fail or node is cut:
+            shape.append(node)
+        else:
+            shape.append(None)
+            leaves.append((node,))
+    return tuple(shape), leaves
+
+
+# The code, the marks of the constants, and the number of slots of the goals
+# compiled so far, by their shapes. Goals of the same shape differ only in
+# their leaves, so the bodies of a recursive predicate are lowered only once.
+# Shapes also depend on the data, like the number of values in 'unify_any', so
+# only the most recently used programs are kept, latest last:
+_programs: dict[tuple, tuple[tuple, tuple, int]] = {}
+_MAX_PROGRAMS = 256
+# Goals are compiled in the threads of 'par_amb' too:
+_compiling = Lock()
+
+
+def _compile(goal:Goal) -> tuple[tuple, tuple, int]:
+    '''Compile goal to code for the virtual machine. Return the code, the
+    constants it refers to, and the number of slots it needs.'''
+    shape, leaves = _flatten(goal)
+    with _compiling:
+        program = _programs.pop(shape, None)
+        if program is None:
+            program = _lower(goal)
+            while len(_programs) >= _MAX_PROGRAMS:
+                del _programs[next(iter(_programs))]
+        _programs[shape] = program
+    code, marks, slots = program
+    # Calls and opaque goals also need the slot of the mark a 'cut' in them
+    # prunes to:
+    consts = tuple(leaf if mark is None else (*leaf, mark)
+                   for leaf, mark in zip(leaves, marks))
+    return code, consts, slots
+
+
+def _lower(goal:Goal) -> tuple[tuple, tuple, int]:
+    '''Lower goal to code for the virtual machine. Return the code, the mark
+    slot of each constant it refers to, or None if it has none, and the
+    number of slots it needs.'''
+    code: list[int] = []
+    marks: list[Optional[int]] = []
+    # Slot 0 holds the mark of the caller, which is where a 'cut' outside of
+    # any 'amb' prunes to:
+    slots = 1
+
+    def emit(op:_Op, arg:int=0) -> int:
+        code.extend((op, arg))
+        return len(code) - 1
+
+    def constant(mark:Optional[int]=None) -> int:
+        marks.append(mark)
+        return len(marks) - 1
+
+    def lower(goal:Goal, mark:int):
+        nonlocal slots
+        for each in _conjuncts(goal):
+            match each:
+                case _ if each is fail:
+                    emit(_Op.FAIL)
+                case _ if each is cut:
+                    emit(_Op.CUT, mark)
+                case _Choice():
+                    alternatives(each, mark)
+                case _Amb():
+                    # 'amb' is the only combinator that sets a new mark:
+                    slot = slots
+                    slots += 1
+                    emit(_Op.MARK, slot)
+                    alternatives(each.joined, slot)
+                case _No():
+                    lower(amb(seq(each.goal, cut, fail), unit), mark)
+                case _Unify():
+                    emit(_Op.UNIFY, constant())
+                case _Predicate():
+                    emit(_Op.CALL, constant(mark))
+                case _:
+                    emit(_Op.INVOKE, constant(mark))
+
+    def alternatives(goal:Goal, mark:int):
+        *goals, last = tuple(_disjuncts(goal)) or (fail,)
+        exits: list[int] = []
+        for each in goals:
+            retry = emit(_Op.TRY)
+            lower(each, mark)
+            exits.append(emit(_Op.JUMP))
+            code[retry] = len(code)
+        lower(last, mark)
+        for jump in exits:
+            code[jump] = len(code)
+
+    lower(goal, 0)
+    emit(_Op.RET)
+    # A CALL that is followed by nothing but a RET doesn't need to return
+    # here, so the body of the predicate can run in the place of this one:
+    for pc in range(0, len(code), 2):
+        if code[pc] == _Op.CALL and _returns(code, pc + 2):
+            code[pc] = _Op.TAILCALL
+    return tuple(code), tuple(marks), slots
+
+
+def _returns(code:list[int], pc:int) -> bool:
+    '''Check whether the code at pc returns without doing anything else.'''
+    while code[pc] == _Op.JUMP:
+        pc = code[pc + 1]
+    return code[pc] == _Op.RET
+
+
+class _Machine:
+    '''The state of the virtual machine.'''
+    # pylint: disable=R0902
+    __slots__ = (
+        'code', 'consts', 'pc', 'env', 'cont', 'subst',
+        'choices', 'succeed', 'exit', 'escape',
+    )
+
+    def __init__(self, program, subst, succeed, backtrack, escape):
+        self.code, self.consts, size = program
+        self.pc = 0
+        # The root mark -1 means that a 'cut' escapes the whole program:
+        self.env = [-1] + [0] * (size - 1)
+        self.cont = None
+        self.subst = subst
+        self.choices = []
+        self.succeed = succeed
+        self.exit = backtrack
+        self.escape = escape
+
+
+# Signals that an opaque goal invoked its escape continuation:
+_ESCAPED = object()
+
+
+def _escaped() -> Result:
+    return _ESCAPED, _escaped  # type: ignore
+
+
+def _cut(m:_Machine, mark:int):
+    if mark < 0:
+        m.choices.clear()
+        m.exit = m.escape
+    else:
+        del m.choices[mark:]
+
+
+def _receive(m:_Machine, result:Result, mark:int) -> bool:
+    '''Take the next solution of an opaque goal from result. Return whether
+    there was one.'''
     while result:
+        if type(result) is Thunk:
+            result = _bounce(result)
+            continue
         subst, next = result  # type: ignore
-        if subst:
-            yield subst.proxy  # type: ignore
-        result = next()
+        if subst is _ESCAPED:
+            _cut(m, mark)
+            return False
+        m.choices.append((
+            m.code, m.consts, m.pc, m.env, m.cont,
+            subst, len(subst.trail), (next, mark),
+        ))
+        m.subst = subst
+        return True
+    return False
+
+
+def _retry(m:_Machine) -> Optional[Result]:
+    '''Backtrack to the youngest choice point. Return None to continue
+    running the machine, or a Result to leave it.'''
+    while m.choices:
+        (m.code, m.consts, m.pc, m.env, m.cont,
+         subst, trail, pending) = m.choices.pop()
+        subst.pop_to(trail)
+        m.subst = subst
+        if pending is None:
+            return None
+        next, mark = pending
+        if _receive(m, next(), mark):
+            return None
+    return m.exit()
+
+
+def _op_fail(m:_Machine, arg:int) -> Optional[Result]:
+    return _retry(m)
+
+
+def _op_jump(m:_Machine, arg:int) -> None:
+    m.pc = arg
+
+
+def _op_try(m:_Machine, arg:int) -> None:
+    subst = m.subst
+    m.choices.append((
+        m.code, m.consts, arg, m.env, m.cont,
+        subst, len(subst.trail), None,
+    ))
+    m.pc += 2
+
+
+def _op_mark(m:_Machine, arg:int) -> None:
+    m.env[arg] = len(m.choices)
+    m.pc += 2
+
+
+def _op_cut(m:_Machine, arg:int) -> None:
+    _cut(m, m.env[arg])
+    m.pc += 2
+
+
+def _op_unify(m:_Machine, arg:int) -> Optional[Result]:
+    unifier, pairs = m.consts[arg]
+    if not unifier(m.subst, pairs):
+        return _retry(m)
+    m.pc += 2
+    return None
+
+
+def _op_call(m:_Machine, arg:int) -> None:
+    func, args, kwargs, slot = m.consts[arg]
+    code, consts, size = _compile(func(*args, **kwargs))
+    env = [m.env[slot]] + [0] * (size - 1)
+    m.cont = m.code, m.consts, m.pc + 2, m.env, m.cont
+    m.code, m.consts, m.pc, m.env = code, consts, 0, env
+
+
+def _op_tailcall(m:_Machine, arg:int) -> None:
+    func, args, kwargs, slot = m.consts[arg]
+    code, consts, size = _compile(func(*args, **kwargs))
+    env = [m.env[slot]] + [0] * (size - 1)
+    m.code, m.consts, m.pc, m.env = code, consts, 0, env
+
+
+def _op_invoke(m:_Machine, arg:int) -> Optional[Result]:
+    goal, slot = m.consts[arg]
+    m.pc += 2
+    if _receive(m, goal(m.subst)(success, failure, _escaped), m.env[slot]):
+        return None
+    return _retry(m)
+
+
+def _op_ret(m:_Machine, arg:int) -> Optional[Result]:
+    if m.cont is None:
+        return m.succeed(m.subst, _Resume(m))
+    m.code, m.consts, m.pc, m.env, m.cont = m.cont
+    return None
+
+
+# The instruction handlers, indexed by opcode:
+_HANDLERS = (
+    _op_fail,
+    _op_jump,
+    _op_try,
+    _op_mark,
+    _op_cut,
+    _op_unify,
+    _op_call,
+    _op_invoke,
+    _op_ret,
+    _op_tailcall,
+)
+
+
+@dataclass(slots=True, eq=False)
+class _Resume:
+    '''The continuation that backtracks into the machine m after it emitted
+    a solution.'''
+    m: _Machine
+
+    @tailcall
+    def __call__(self) -> Result:
+        return _retry(self.m) or _run(self.m)
+
+
+def _run(m:_Machine) -> Result:
+    '''Run the machine until it emits a solution or is exhausted.'''
+    handlers = _HANDLERS
+    while True:
+        code = m.code
+        pc = m.pc
+        result = handlers[code[pc]](m, code[pc + 1])
+        if result is not None:
+            return result
+
+
+@dataclass(slots=True, eq=False)
+class _CompiledStep:
+    '''The step that runs program on a new machine for subst.'''
+    program: tuple[tuple, tuple, int]
+    subst: Subst
+
+    @tailcall
+    def __call__(self, succeed:Emit, backtrack:Next, escape:Next) -> Result:
+        return _run(_Machine(
+            self.program, self.subst, succeed, backtrack, escape))
+
+
+@dataclass(slots=True, eq=False)
+class _Compiled:
+    '''The goal that runs program, which was compiled from a goal.'''
+    program: tuple[tuple, tuple, int]
+
+    def __call__(self, subst:Subst) -> Step:
+        return _CompiledStep(self.program, subst)
+
+
+def compiled(goal:Goal) -> Goal:
+    '''Compile goal to code for a virtual machine that runs it in a single
+    loop instead of through a tower of continuations. The bodies of
+    predicates are compiled when they are called. Other goals that aren't
+    made of the combinators of this module are resolved as they are.'''
+    return _Compiled(_compile(goal))
+
+
+def resolve(goal:Goal) -> Generator[Mapping, None, None]:
+    '''Start the logical resolution of 'goal'. Return all solutions.'''
+    solutions = _solutions(goal(Subst()))
+    try:
+        for subst in solutions:
+            yield subst.proxy
+    finally:
+        # Like in resolve_n, closing the search right away stops e.g. the
+        # workers of a 'par_amb':
+        solutions.close()
+
+
+def resolve_n(goal:Goal, n:int) -> Iterable[Mapping]:
+    '''Start the logical resolution of 'goal'. Return at most n solutions.
+    The search stops as soon as the n-th solution is found, or when the
+    solutions are closed.'''
+    solutions = resolve(goal)
+    try:
+        yield from islice(solutions, n)
+    finally:
+        # Closing the search right away stops e.g. the workers of a
+        # 'par_amb', instead of leaving that to the garbage collector:
+        solutions.close()
@@ -0,0 +1,725 @@
+# Copyright (c) 2021 Mick Krippendorf <m.krippendorf@freenet.de>
+
+import inspect
+import subprocess
+import sys
+import threading
+import time
+import unittest
+import weakref
+from collections import namedtuple
+from itertools import count, islice
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / 'src'
+sys.path.insert(0, str(SRC))
+
+from yogic import (Subst, Variable, amb, compiled, condition, cut, fail,
+                   guard, memoized, no, par_amb, predicate, reset_table,
+                   resolve, resolve_n, seq, tabled, unify, unify_any, unit,
+                   var)
+
+
+def values(goal, *variables):
+    return [tuple(subst[v] for v in variables) for subst in resolve(goal)]
+
+
+def settle(threads, timeout=5):
+    '''Wait until no more than threads threads are running, and return how
+    many there are.'''
+    deadline = time.monotonic() + timeout
+    while (threading.active_count() > threads
+           and time.monotonic() < deadline):
+        time.sleep(0.01)
+    return threading.active_count()
+
+
+def countdown(decorator):
+    '''Return a predicate, made with decorator, that recurses n times before
+    it binds r.'''
+
+    @decorator
+    def down(n, r):
+        if n == 0:
+            return unify((r, 'done'))
+        return seq(unify((n, n)), down(n - 1, r))
+
+    return down
+
+
+class TestSolutions(unittest.TestCase):
+
+    def test_lists_are_copied(self):
+        x, y = var(), var()
+        solution, = resolve(unify((x, [1, y]), (y, 2)))
+        solution[x].append(3)
+        self.assertEqual(solution[x], [1, 2])
+        solution, = resolve(unify((x, ([1], y)), (y, 2)))
+        solution[x][0].append(3)
+        self.assertEqual(solution[x], ([1], 2))
+
+    def test_tuples_are_shared(self):
+        x, y = var(), var()
+        solution, = resolve(unify((x, (1, y)), (y, 2)))
+        self.assertEqual(solution[x], (1, 2))
+        self.assertIs(solution[x], solution[x])
+
+    def test_cyclic(self):
+        x = var()
+        solution, = resolve(unify((x, [1, x])))
+        with self.assertRaises(ValueError):
+            solution[x]
+        # The same term in two places is no cycle:
+        y = var()
+        solution, = resolve(unify((x, [y, (y,)]), (y, (1, 2))))
+        self.assertEqual(solution[x], [(1, 2), ((1, 2),)])
+
+    def test_cyclic_unified(self):
+        x, y = var(), var()
+        self.assertEqual(
+            len(list(resolve(unify((x, [1, x]), (y, [1, y]), (x, y))))), 1)
+        self.assertEqual(
+            list(resolve(unify((x, [1, x]), (y, [2, y]), (x, y)))), [])
+
+    def test_sequence_types(self):
+        Point = namedtuple('Point', 'x y')
+        x = var()
+        self.assertEqual(len(list(resolve(unify((Point(1, 2), (1, 2)))))), 1)
+        self.assertEqual(list(resolve(unify((Point(1, x), (1, 2))))), [])
+        self.assertEqual(list(resolve(unify(([1, 2], (1, 2))))), [])
+
+
+class TestSubst(unittest.TestCase):
+
+    def test_compression_undone(self):
+        xs = [var() for _ in range(10)]
+        subst = Subst()
+        for this, that in zip(xs, xs[1:]):
+            subst.assign(this, that)
+        bindings = dict(subst.bindings)
+        mark = len(subst.trail)
+        subst.assign(xs[-1], 'a')
+        self.assertEqual(subst.deref(xs[0]), 'a')
+        # The chain was compressed:
+        self.assertEqual(subst.bindings[xs[0].id], 'a')
+        subst.pop_to(mark)
+        self.assertEqual(subst.bindings, bindings)
+        self.assertEqual(subst.trail, [x.id for x in xs[:-1]])
+
+    def test_compression_backtracked(self):
+
+        @condition
+        def anything(_):
+            return True
+
+        xs = [var() for _ in range(10)]
+        first, last = xs[0], xs[-1]
+        goal = seq(
+            unify(*zip(xs, xs[1:])),
+            amb(
+                # Dereferencing first compresses the chain to 'a':
+                seq(unify((last, 'a')), anything(first), fail),
+                unify((last, 'b')),
+            ),
+        )
+        self.assertEqual(values(goal, first), [('b',)])
+
+
+class TestAmb(unittest.TestCase):
+
+    def test_order(self):
+        x = var()
+        for k in (1, 2, 3, 4, 5, 7, 8, 9, 100, 101):
+            goal = amb(*(unify((x, i)) for i in range(k)))
+            self.assertEqual(values(goal, x), [(i,) for i in range(k)])
+        self.assertEqual(values(amb(), x), [])
+
+    def test_splice(self):
+        x = var()
+        goal = amb(unify((x, 0)), amb(unify((x, 1)), unify((x, 2))),
+                   unify((x, 3)))
+        self.assertEqual(values(goal, x), [(0,), (1,), (2,), (3,)])
+
+    def test_cut_barrier(self):
+        x = var()
+        goal = amb(amb(seq(unify((x, 1)), cut), unify((x, 2))),
+                   unify((x, 3)))
+        # The nested amb is not spliced, so its cut prunes only its own
+        # alternatives:
+        self.assertEqual(values(goal, x), [(1,), (3,)])
+
+
+class TestCompiled(unittest.TestCase):
+
+    def check(self, make, *variables):
+        self.assertEqual(values(compiled(make()), *variables),
+                         values(make(), *variables))
+
+    def test_amb(self):
+        x, y = var(), var()
+        self.check(lambda: seq(unify_any(x, 1, 2, 3), unify_any(y, 'a', 'b')),
+                   x, y)
+
+    def test_cut(self):
+        x = var()
+        self.check(lambda: seq(unify_any(x, 1, 2, 3), cut), x)
+        self.check(lambda: amb(seq(unify((x, 1)), cut, fail),
+                               unify((x, 2))), x)
+
+    def test_cut_in_predicate(self):
+        x = var()
+
+        @predicate
+        def first(x):
+            return seq(unify_any(x, 1, 2, 3), cut)
+
+        self.check(lambda: amb(first(x), unify((x, 4))), x)
+
+    def test_tail_recursion(self):
+        r = var()
+
+        @predicate
+        def down(n, r):
+            if n == 0:
+                return unify((r, 'done'))
+            # The recursive call jumps over the pending alternative:
+            return amb(down(n - 1, r), unify((r, n)))
+
+        self.check(lambda: down(100_000, r), r)
+
+    def test_many_shapes(self):
+        x = var()
+        # More shapes than are kept, so that programs get evicted:
+        for k in range(1, 600):
+            self.assertEqual(len(values(compiled(unify_any(x, *range(k))),
+                                        x)),
+                             k)
+
+    def test_no(self):
+        x = var()
+        self.check(lambda: seq(unify_any(x, 1, 2, 3), no(unify((x, 2)))), x)
+        self.check(lambda: no(seq(unify_any(x, 1, 2), cut, unify((x, 2)))),
+                   x)
+
+
+class TestPredicate(unittest.TestCase):
+
+    def params(self, pred):
+        return list(inspect.signature(pred).parameters)
+
+    def test_fixed(self):
+
+        @predicate
+        def pair(a, b):
+            return unify((a, 1), (b, 2))
+
+        x, y = var(), var()
+        self.assertEqual(self.params(pair), ['a', 'b'])
+        self.assertEqual(pair.__name__, 'pair')
+        self.assertEqual(values(pair(x, y), x, y), [(1, 2)])
+        self.assertEqual(values(pair(x, b=y), x, y), [(1, 2)])
+        self.assertEqual(values(pair(b=y, a=x), x, y), [(1, 2)])
+        # Unlike the variadic wrapper, the generated one checks its
+        # arguments when it is called:
+        with self.assertRaises(TypeError):
+            pair(x)
+        with self.assertRaises(TypeError):
+            pair(x, y, c=1)
+
+    def test_colliding_names(self):
+
+        @predicate
+        def clash(func, kwargs, make):
+            return unify((func, 1), (kwargs, 2), (make, 3))
+
+        x, y, z = var(), var(), var()
+        self.assertEqual(self.params(clash), ['args', 'kwargs'])
+        self.assertEqual(values(clash(x, y, z), x, y, z), [(1, 2, 3)])
+        self.assertEqual(values(clash(x, y, make=z), x, y, z), [(1, 2, 3)])
+
+    def test_variadic_fallback(self):
+
+        @predicate
+        def default(a, b=2):
+            return unify((a, b))
+
+        @predicate
+        def rest(a, *bs):
+            return unify((a, bs))
+
+        @predicate
+        def keyword(a, *, b):
+            return unify((a, b))
+
+        @predicate
+        def positional(a, /, b):
+            return unify((a, b))
+
+        x = var()
+        for pred in (default, rest, keyword, positional):
+            self.assertEqual(self.params(pred), ['args', 'kwargs'])
+        self.assertEqual(values(default(x), x), [(2,)])
+        self.assertEqual(values(default(x, b=3), x), [(3,)])
+        self.assertEqual(values(rest(x, 1, 2), x), [((1, 2),)])
+        self.assertEqual(values(keyword(x, b=4), x), [(4,)])
+        self.assertEqual(values(positional(x, b=5), x), [(5,)])
+
+
+class TestTabled(unittest.TestCase):
+
+    edges = [(1, 2), (2, 3), (3, 1), (3, 4)]
+
+    def test_left_recursion(self):
+
+        @tabled
+        def path(a, b):
+            c = var()
+            return amb(
+                seq(path(a, c), edge(c, b)),
+                edge(a, b),
+            )
+
+        @predicate
+        def edge(a, b):
+            return amb(*(unify((a, x), (b, y)) for x, y in self.edges))
+
+        x = var()
+        self.assertEqual(sorted(values(path(1, x), x)),
+                         [(1,), (2,), (3,), (4,)])
+        # Replayed from the table:
+        self.assertEqual(sorted(values(path(1, x), x)),
+                         [(1,), (2,), (3,), (4,)])
+        reset_table(path)
+        self.assertEqual(path.table, {})
+
+    def test_reset_during_evaluation(self):
+
+        @tabled
+        def p(x):
+            return amb(unify((x, 1)), q(x))
+
+        @tabled
+        def q(x):
+            return seq(guard(lambda s: reset_table(q) or True), p(x))
+
+        x = var()
+        self.assertEqual(values(p(x), x), [(1,)])
+
+    def test_keyword_arguments(self):
+
+        @tabled
+        def path(a, b):
+            return amb(*(unify((a, x), (b, y)) for x, y in self.edges))
+
+        @tabled
+        def step(a, b=1):
+            return unify((b, a + 1))
+
+        x = var()
+        self.assertEqual(values(path(b=x, a=3), x), [(1,), (4,)])
+        self.assertEqual(values(path(3, b=x), x), [(1,), (4,)])
+        self.assertEqual(len(path.table), 1)
+        self.assertEqual(values(step(0)), [()])
+        self.assertEqual(values(step(a=0, b=1)), [()])
+        self.assertEqual(values(step(1, b=x), x), [(2,)])
+        self.assertEqual(len(step.table), 2)
+
+        @tabled
+        def named(a, *, b):
+            return unify((a, b))
+
+        with self.assertRaises(TypeError):
+            named(1, b=x)
+
+    def test_deep_recursion(self):
+        down = countdown(tabled)
+        r = var()
+        self.assertEqual(values(down(5000, r), r), [('done',)])
+
+    def test_unhashable(self):
+
+        @tabled
+        def ident(a, b):
+            return unify((a, b))
+
+        x = var()
+        with self.assertRaises(TypeError):
+            list(resolve(ident({}, x)))
+        # The lock of the tables must not be held anymore:
+        found = []
+        thread = threading.Thread(
+            target=lambda: found.extend(values(ident(1, x), x)), daemon=True)
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(found, [(1,)])
+
+    def test_equal_atoms(self):
+
+        @tabled
+        def ident(a, b):
+            return unify((a, b))
+
+        x = var()
+        for atom in (1, 1.0, True, [1], [1.0], [True]):
+            (value,), = values(ident(atom, x), x)
+            self.assertEqual(repr(value), repr(atom))
+
+    def test_namedtuple(self):
+        Point = namedtuple('Point', 'x y')
+
+        @tabled
+        def point(p):
+            return unify((p, Point(1, 2)))
+
+        x = var()
+        self.assertEqual(values(point(Point(x, 2)), x), [(1,)])
+
+
+class TestMemoized(unittest.TestCase):
+
+    def test_hits_and_reset(self):
+        calls = []
+
+        @memoized
+        def square(n, r):
+            calls.append(n)
+            return unify((r, n * n))
+
+        r = var()
+        self.assertEqual(values(square(3, r), r), [(9,)])
+        self.assertEqual(values(square(3, r), r), [(9,)])
+        self.assertEqual(values(square(4, r), r), [(16,)])
+        self.assertEqual(calls, [3, 4])
+        reset_table(square)
+        self.assertEqual(values(square(3, r), r), [(9,)])
+        self.assertEqual(calls, [3, 4, 3])
+
+    def test_variants_share_answers(self):
+        calls = []
+
+        @memoized
+        def pair(a, b):
+            calls.append((a, b))
+            return amb(unify((a, 1), (b, 2)), unify((a, 3), (b, 4)))
+
+        x, y = var(), var()
+        self.assertEqual(values(pair(x, y), x, y), [(1, 2), (3, 4)])
+        u, v = var(), var()
+        self.assertEqual(values(pair(u, v), u, v), [(1, 2), (3, 4)])
+        self.assertEqual(len(calls), 1)
+
+    def test_deep_recursion(self):
+        down = countdown(memoized)
+        r = var()
+        self.assertEqual(values(down(5000, r), r), [('done',)])
+
+    def test_equal_atoms(self):
+
+        @memoized
+        def show(a, r):
+            return unify((r, repr(a)))
+
+        r = var()
+        for atom in (1, 1.0, True, [1], [1.0], [True]):
+            self.assertEqual(values(show(atom, r), r), [(repr(atom),)])
+
+    def test_variant_recursion(self):
+
+        @memoized
+        def loop(x):
+            return loop(x)
+
+        self.assertEqual(list(resolve(loop(1))), [])
+        self.assertIs(memoized, tabled)
+
+
+class TestLazyAmb(unittest.TestCase):
+
+    def test_infinite(self):
+        x = var()
+        goal = amb.lazy(unify((x, i)) for i in count())
+        self.assertEqual([s[x] for s in islice(resolve(goal), 3)], [0, 1, 2])
+
+    def test_takes_goals_lazily(self):
+        x = var()
+        taken = []
+
+        def goals():
+            for i in count():
+                taken.append(i)
+                yield unify((x, i))
+
+        next(iter(resolve(amb.lazy(goals()))))
+        self.assertEqual(taken, [0])
+
+    def test_resolve_again(self):
+        x = var()
+        goal = amb.lazy([unify((x, i)) for i in range(3)])
+        self.assertEqual(values(goal, x), [(0,), (1,), (2,)])
+        self.assertEqual(values(goal, x), [(0,), (1,), (2,)])
+
+    def test_iterator_again(self):
+        x = var()
+        goal = amb.lazy(unify((x, i)) for i in range(3))
+        self.assertEqual(values(goal, x), [(0,), (1,), (2,)])
+        self.assertEqual(values(goal, x), [(0,), (1,), (2,)])
+
+    def test_reentered(self):
+        x, y = var(), var()
+        for goals in (iter([unit, unit]), [unit, unit]):
+            goal = seq(amb(unify((x, 1)), unify((x, 2))), amb.lazy(goals))
+            self.assertEqual(values(goal, x), [(1,), (1,), (2,), (2,)])
+        goal = seq(unify_any(x, 1, 2),
+                   amb.lazy(unify((y, i)) for i in count()))
+        self.assertEqual([(s[x], s[y]) for s in resolve_n(goal, 3)],
+                         [(1, 0), (1, 1), (1, 2)])
+
+    def test_drops_tried_goals(self):
+        x = var()
+        refs = []
+
+        def goals():
+            for i in count():
+                def goal(subst, i=i):
+                    return unify((x, i))(subst)
+                refs.append(weakref.ref(goal))
+                yield goal
+
+        class Goals:
+            def __iter__(self):
+                return goals()
+
+        solutions = resolve(amb.lazy(Goals()))
+        self.assertEqual([s[x] for s in islice(solutions, 100)],
+                         list(range(100)))
+        self.assertLess(sum(ref() is not None for ref in refs), 3)
+
+    def test_cut(self):
+        x = var()
+        goals = (unify((x, i)) for i in count())
+        self.assertEqual(values(seq(amb.lazy(goals), cut), x), [(0,)])
+        # A cut in an alternative prunes the remaining ones:
+        goal = amb.lazy([unify((x, 1)), seq(unify((x, 2)), cut),
+                         unify((x, 3))])
+        self.assertEqual(values(goal, x), [(1,), (2,)])
+        # ... but not the choice points outside of it:
+        self.assertEqual(values(amb(goal, unify((x, 4))), x),
+                         [(1,), (2,), (4,)])
+
+    def test_deep_recursion(self):
+
+        @predicate
+        def down(n, r):
+            if n == 0:
+                return unify((r, 'done'))
+            return amb.lazy([down(n - 1, r), fail])
+
+        r = var()
+        self.assertEqual(values(down(100_000, r), r), [('done',)])
+
+    def test_shared_between_threads(self):
+        x = var()
+
+        def goals():
+            for i in range(50):
+                # Give the other worker a chance to ask for the next goal:
+                time.sleep(0.001)
+                yield unify((x, i))
+
+        class Goals:
+            def __iter__(self):
+                return goals()
+
+        # Both alternatives try all goals, whether they take them from the
+        # same iterator or from one each:
+        for goal in (amb.lazy(goals()), amb.lazy(Goals())):
+            self.assertEqual(
+                sorted(values(par_amb(goal, goal, workers=2), x)),
+                sorted([(i,) for i in range(50)] * 2))
+
+
+class TestResolveN(unittest.TestCase):
+
+    def test_limits(self):
+        x = var()
+        goal = unify_any(x, 1, 2, 3)
+        self.assertEqual([s[x] for s in resolve_n(goal, 2)], [1, 2])
+        self.assertEqual([s[x] for s in resolve_n(goal, 5)], [1, 2, 3])
+        self.assertEqual(list(resolve_n(goal, 0)), [])
+
+    def test_stops_search(self):
+        x = var()
+        taken = []
+
+        def goals():
+            for i in count():
+                taken.append(i)
+                yield unify((x, i))
+
+        goal = amb.lazy(goals())
+        self.assertEqual([s[x] for s in resolve_n(goal, 2)], [0, 1])
+        self.assertEqual(taken, [0, 1])
+
+    def test_early_close(self):
+        x = var()
+        threads = threading.active_count()
+        evens = amb.lazy(unify((x, i)) for i in count(0, 2))
+        odds = amb.lazy(unify((x, i)) for i in count(1, 2))
+        solutions = resolve_n(par_amb(evens, odds), 10)
+        next(solutions)
+        solutions.close()
+        self.assertEqual(settle(threads), threads)
+
+
+class TestCondition(unittest.TestCase):
+
+    def test_bound(self):
+
+        @condition
+        def less(a, b):
+            return a < b
+
+        x = var()
+        self.assertEqual(values(seq(unify_any(x, 1, 2, 3), less(x, 3)), x),
+                         [(1,), (2,)])
+        self.assertEqual(values(less(2, 1)), [])
+        self.assertEqual(values(less(1, 2)), [()])
+
+    def test_keyword_arguments(self):
+
+        @condition
+        def less(a, b):
+            return a < b
+
+        @condition
+        def within(a, *, low=0, high):
+            return low <= a <= high
+
+        x = var()
+        self.assertEqual(values(seq(unify_any(x, 1, 2, 3), less(b=x, a=1)), x),
+                         [(2,), (3,)])
+        self.assertEqual(values(seq(unify_any(x, 1, 2, 3), within(x, high=2)),
+                                x),
+                         [(1,), (2,)])
+        self.assertEqual(values(seq(unify((x, 3)), within(2, low=x, high=4))),
+                         [])
+
+    def test_nested(self):
+
+        @condition
+        def ordered(pair):
+            return pair[0] <= pair[1]
+
+        x, y = var(), var()
+        goal = seq(unify((x, [1, y]), (y, 2)), ordered(x))
+        self.assertEqual(values(goal, x), [([1, 2],)])
+
+    def test_unbound(self):
+
+        @condition
+        def unbound(a):
+            return type(a) is Variable
+
+        x = var()
+        self.assertEqual(values(unbound(x)), [()])
+        self.assertEqual(values(seq(unify((x, 1)), unbound(x))), [])
+
+
+class TestGuard(unittest.TestCase):
+
+    def test_bound(self):
+        x = var()
+        goal = seq(unify_any(x, 1, 2, 3), guard(lambda s: s[x] != 2))
+        self.assertEqual(values(goal, x), [(1,), (3,)])
+
+    def test_unbound(self):
+        x, y = var(), var()
+        goal = seq(unify((x, [1, y])), guard(lambda s: type(s[y]) is Variable))
+        self.assertEqual(values(goal, x), [([1, y],)])
+        goal = seq(unify((x, [1, y]), (y, 2)),
+                   guard(lambda s: type(s[y]) is Variable))
+        self.assertEqual(values(goal, x), [])
+
+    def test_prunes(self):
+        x = var()
+        tried = []
+
+        def expensive(s):
+            tried.append(s[x])
+            return True
+
+        goal = seq(unify_any(x, 1, 2, 3), guard(lambda s: s[x] % 2),
+                   guard(expensive))
+        self.assertEqual(values(goal, x), [(1,), (3,)])
+        self.assertEqual(tried, [1, 3])
+
+
+class TestParAmb(unittest.TestCase):
+
+    def test_solutions(self):
+        x = var()
+        self.assertEqual(sorted(values(par_amb(unify((x, 1)), unify((x, 2))),
+                                       x)),
+                         [(1,), (2,)])
+
+    def test_workers(self):
+        x = var()
+        goals = unify((x, 1)), unify((x, 2))
+        self.assertEqual(sorted(values(par_amb(*goals, workers=1), x)),
+                         [(1,), (2,)])
+        for workers in (0, -1):
+            with self.assertRaises(ValueError):
+                par_amb(*goals, workers=workers)
+
+    def test_in_tabled(self):
+
+        @tabled
+        def top(x):
+            return par_amb(leaf(x, 1), leaf(x, 2), leaf(x, 3))
+
+        @tabled
+        def leaf(x, n):
+            return unify((x, n))
+
+        x = var()
+        self.assertEqual(sorted(values(top(x), x)), [(1,), (2,), (3,)])
+
+    def test_cut_in_function(self):
+        x = var()
+
+        def first_only(subst):
+            return seq(unify_any(x, 1, 2), cut)(subst)
+
+        self.assertEqual(values(par_amb(first_only, unify((x, 3))), x),
+                         values(amb(first_only, unify((x, 3))), x))
+
+    def test_workers_stop_after_cut(self):
+        x = var()
+        threads = threading.active_count()
+        goal = amb(seq(par_amb(unify((x, 1)), unify((x, 2))), cut),
+                   unify((x, 3)))
+        self.assertEqual(len(values(goal, x)), 1)
+        self.assertEqual(settle(threads), threads)
+
+    def test_termination(self):
+        # The workers of an abandoned par_amb must not keep the interpreter
+        # alive:
+        script = '\n'.join([
+            'from itertools import count',
+            'from yogic import amb, cut, par_amb, resolve, resolve_n, seq, '
+            'unify, var',
+            'x = var()',
+            'def nat(x):',
+            '    return amb.lazy(unify((x, i)) for i in count())',
+            'assert len(list(resolve_n(par_amb(nat(x), nat(x)), 3))) == 3',
+            "goal = seq(par_amb(nat(x), unify((x, 'a'))), cut)",
+            'assert len(list(resolve(goal))) == 1',
+        ])
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=SRC, timeout=30)
+        self.assertEqual(result.returncode, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()